@@ -1,149 +1,480 @@
 import sqlite3
 import os
 import sys
+import json
+import queue
+import threading
+import time
 import traceback
-from flask import Flask, jsonify, request, render_template
+import types
+import collections
+from contextlib import contextmanager
+import orjson
+from flask import Flask, Response, jsonify, request, render_template
 from flask.templating import TemplateNotFound
 from flask_cors import CORS
-from datetime import datetime
 
 # --- Basic Setup ---
 app = Flask(__name__)
 CORS(app)
 
 DATABASE_FILE = 'inventory.db'
+# Stored in PRAGMA user_version once setup_database has run; bump it whenever the schema changes
+SCHEMA_VERSION = 2
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), DATABASE_FILE)
 
-def connect_to_database():
-    """Connects to the SQLite database."""
-    db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), DATABASE_FILE)
+# Worker threads for the production server (waitress here, or gunicorn via gunicorn.conf.py)
+SERVER_THREADS = 8
+
+# Process-wide pools of open connections, reused across requests: writers for requests that change
+# data, read-only connections for the GET endpoints (in WAL mode readers never wait on the writer).
+# LIFO so the most recently used (warmest) connection is handed out first.
+# Sized to the server's thread count so every worker thread can keep one open.
+POOL_SIZE = SERVER_THREADS
+_WRITER_POOL = queue.LifoQueue(maxsize=POOL_SIZE)
+_READER_POOL = queue.LifoQueue(maxsize=POOL_SIZE)
+
+def connect_to_database(read_only=False):
+    """Connects to the SQLite database, optionally as a read-only connection."""
     try:
-        conn = sqlite3.connect(db_path)
+        # isolation_level=None: autocommit, transactions are opened explicitly where needed
+        if read_only:
+            conn = sqlite3.connect(f'file:{DB_PATH}?mode=ro', uri=True, check_same_thread=False, isolation_level=None)
+        else:
+            conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
         conn.row_factory = sqlite3.Row # Allows accessing columns by name
+        if read_only:
+            conn.execute("PRAGMA query_only=1")
+        else:
+            # WAL lets readers run alongside a writer; NORMAL sync is safe in WAL and skips most fsyncs
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=268435456") # 256 MB
+        conn.execute("PRAGMA cache_size=-65536") # 64 MB
         return conn
     except sqlite3.Error as e:
         print(f"Database connection error: {e}")
         return None
 
-def setup_database():
-    """Creates the necessary database tables if they don't exist."""
-    conn = connect_to_database()
-    if conn is None:
-        print("FATAL: Could not connect to the database to run setup.")
-        return
-        
+@contextmanager
+def _borrow_connection(pool, read_only):
+    """
+    Borrows a connection from the pool, opening a new one if the pool is empty,
+    and returns it to the pool afterwards. Yields None if the connection failed.
+    """
     try:
-        cursor = conn.cursor()
-        # Create CUSTOMER table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS CUSTOMER (
-                CUSTOMER_ID INTEGER PRIMARY KEY AUTOINCREMENT,
-                CUSTOMER_NAME TEXT NOT NULL,
-                MOBILE_NO TEXT NOT NULL UNIQUE,
-                CUSTOMER_TYPE TEXT NOT NULL CHECK(CUSTOMER_TYPE IN ('WHOLESALE', 'RETAIL', 'HOTEL-LINE'))
-            )
-        """)
-        # Create INVENTORY table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS INVENTORY (
-                ID INTEGER PRIMARY KEY AUTOINCREMENT,
-                BRAND TEXT,
-                PRODUCT TEXT,
-                CATEGORY TEXT,
-                STOCK INT,
-                MRP INT NOT NULL,
-                PURCHASE_RATE INT NOT NULL,
-                WHOLESALE_RATE INT NOT NULL,
-                RETAIL_RATE INT NOT NULL,
-                HOTEL_RATE INT NOT NULL,
-                UNIQUE (BRAND, PRODUCT)
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = connect_to_database(read_only)
+    try:
+        yield conn
+    finally:
+        if conn is not None:
+            # Never hand a half-finished transaction to the next request
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+def get_writer_conn():
+    """Borrows a pooled read-write connection (see _borrow_connection)."""
+    return _borrow_connection(_WRITER_POOL, read_only=False)
+
+def get_reader_conn():
+    """Borrows a pooled read-only connection (see _borrow_connection)."""
+    return _borrow_connection(_READER_POOL, read_only=True)
+
+def close_pool():
+    """Closes every idle pooled connection, e.g. before the process forks server workers."""
+    for pool in (_WRITER_POOL, _READER_POOL):
+        while True:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+BILLS_PAGE_SIZE = 100 # Default number of bills returned by /api/bills
+BILLS_MAX_PAGE_SIZE = 1000
+
+def ojsonify(obj, status=200):
+    """Like flask.jsonify, but encodes with orjson (C extension, much faster on large result sets)."""
+    return Response(orjson.dumps(obj), status=status, mimetype='application/json')
+
+# customer_id -> CUSTOMER_TYPE, so repeat customers skip the type lookup in process_bill.
+# No route changes a customer's type after creation, so entries stay valid until evicted.
+# Bounded; the oldest entry is evicted first (dicts keep insertion order).
+CUSTOMER_TYPE_CACHE_SIZE = 1024
+_CUST_TYPE_CACHE = {}
+_CUST_TYPE_LOCK = threading.Lock()
+
+def cache_customer_type(customer_id, customer_type):
+    """Remembers a customer's type, evicting the oldest entry when the cache is full."""
+    with _CUST_TYPE_LOCK:
+        if customer_id not in _CUST_TYPE_CACHE and len(_CUST_TYPE_CACHE) >= CUSTOMER_TYPE_CACHE_SIZE:
+            del _CUST_TYPE_CACHE[next(iter(_CUST_TYPE_CACHE))]
+        _CUST_TYPE_CACHE[customer_id] = customer_type
+
+def forget_customer_type(customer_id):
+    """Drops a cached customer type; call it from any code path that changes CUSTOMER_TYPE."""
+    with _CUST_TYPE_LOCK:
+        _CUST_TYPE_CACHE.pop(customer_id, None)
+
+# Autocomplete fires the same few terms in quick succession while the user types, so suggestion
+# responses are kept briefly as encoded JSON: key -> (expiry time, body), least recently used evicted first.
+SUGGESTION_MIN_LENGTH = 2 # Shorter terms match almost everything and are ignored
+SUGGESTION_LIMIT = 20 # Max suggestions returned per request
+SUGGESTION_CACHE_SIZE = 128
+SUGGESTION_CACHE_TTL = 5.0 # seconds
+_SUGGESTION_CACHE = collections.OrderedDict()
+_SUGGESTION_LOCK = threading.Lock()
+
+def get_cached_suggestions(key):
+    """Returns the cached JSON body for a suggestion query, or None if missing or expired."""
+    with _SUGGESTION_LOCK:
+        entry = _SUGGESTION_CACHE.get(key)
+        if entry is None:
+            return None
+        expires_at, body = entry
+        if expires_at < time.monotonic():
+            del _SUGGESTION_CACHE[key]
+            return None
+        _SUGGESTION_CACHE.move_to_end(key)
+        return body
+
+def cache_suggestions(key, suggestions):
+    """Encodes suggestions to JSON, caches the body under key and returns it."""
+    body = orjson.dumps(suggestions)
+    with _SUGGESTION_LOCK:
+        _SUGGESTION_CACHE[key] = (time.monotonic() + SUGGESTION_CACHE_TTL, body)
+        _SUGGESTION_CACHE.move_to_end(key)
+        while len(_SUGGESTION_CACHE) > SUGGESTION_CACHE_SIZE:
+            _SUGGESTION_CACHE.popitem(last=False)
+    return body
+
+def clear_suggestion_cache():
+    """Drops all cached suggestions, e.g. after a new customer is added."""
+    with _SUGGESTION_LOCK:
+        _SUGGESTION_CACHE.clear()
+
+# --- SQL Statements ---
+# Built once at import so every request reuses the same SQL text and hits sqlite3's statement cache.
+
+# Read-only lookup tables, built once instead of on every request
+_PAYMENT_MAP = types.MappingProxyType({'CASH': 'CASH', 'CARD': 'CARD', 'CREDIT': 'CREDIT', 'UPI': 'ONLINE'})
+# Interned, as are the request values checked against them, so membership tests can match on identity
+_ALLOWED_CUST = frozenset({sys.intern('WHOLESALE'), sys.intern('RETAIL'), sys.intern('HOTEL-LINE')})
+
+SQL_SELECT_CUST_BY_MOBILE = "SELECT CUSTOMER_ID FROM CUSTOMER WHERE MOBILE_NO = ?"
+# Only run after SQL_SELECT_CUST_BY_MOBILE missed. Returns the new CUSTOMER_ID, or no row if
+# a concurrent request registered the mobile number in between.
+SQL_INSERT_CUST = """
+    INSERT INTO CUSTOMER (CUSTOMER_NAME, MOBILE_NO, CUSTOMER_TYPE) VALUES (?, ?, ?)
+    ON CONFLICT(MOBILE_NO) DO NOTHING
+    RETURNING CUSTOMER_ID
+"""
+SQL_SUGGEST_CUST = "SELECT TRIM(CUSTOMER_NAME), MOBILE_NO, CUSTOMER_TYPE_DISPLAY FROM CUSTOMER WHERE TRIM(CUSTOMER_NAME) LIKE ? LIMIT ?"
+SQL_SELECT_CUST_TYPE = "SELECT CUSTOMER_TYPE FROM CUSTOMER WHERE CUSTOMER_ID = ?"
+
+# Selling price for the customer type bound as ?1. Picking the column in SQL instead of formatting
+# it into the query keeps a single statement (and cache entry) for all customer types.
+_PRICE_FOR_CUSTOMER_TYPE = """
+    CASE ?1
+        WHEN 'WHOLESALE' THEN WHOLESALE_RATE
+        WHEN 'RETAIL' THEN RETAIL_RATE
+        WHEN 'HOTEL-LINE' THEN HOTEL_RATE
+    END
+"""
+
+# The product names arrive as a single JSON array (?2) so the SQL text stays the same
+# no matter how many lines the bill has.
+SQL_SELECT_RATES = f"""
+    SELECT ID, FULL_KEY, PURCHASE_RATE, {_PRICE_FOR_CUSTOMER_TYPE} as SELLING_PRICE
+    FROM INVENTORY
+    WHERE FULL_KEY IN (SELECT value FROM json_each(?2))
+"""
+SQL_UPDATE_STOCK = "UPDATE INVENTORY SET STOCK = STOCK - ? WHERE FULL_KEY = ?"
+# *** FIX: Using new column names (TAX_AMOUNT, STATUS) in the INSERT statement ***
+SQL_INSERT_BILL = """
+    INSERT INTO BILLS (CUSTOMER_ID, TOTAL_ITEMS, BILL_AMOUNT, TAX_AMOUNT, TOTAL_AMOUNT, PROFIT_EARNED, PAYMENT_METHOD, PAYMENT_DATE, STATUS)
+    VALUES (?, ?, ?, ?, ?, ?, ?, DATE('now', 'localtime'), ?)
+"""
+SQL_INSERT_BILL_ITEM = "INSERT INTO BILL_ITEMS (BILL_ID, INVENTORY_ID, QUANTITY, UNIT_PRICE) VALUES (?, ?, ?, ?)"
+# *** FIX: Selecting from the new column names to send to the frontend ***
+SQL_SELECT_BILLS_JOIN = """
+    SELECT
+        b.BILL_ID,
+        c.CUSTOMER_NAME,
+        b.TOTAL_ITEMS,
+        b.BILL_AMOUNT,
+        b.TAX_AMOUNT,
+        b.DISCOUNT_AMOUNT,
+        b.TOTAL_AMOUNT,
+        b.PROFIT_EARNED,
+        b.PAYMENT_METHOD,
+        b.PAYMENT_DATE,
+        b.STATUS
+    FROM BILLS b
+    JOIN CUSTOMER c ON b.CUSTOMER_ID = c.CUSTOMER_ID
+    WHERE b.BILL_ID < ?
+    ORDER BY b.BILL_ID DESC
+    LIMIT ?
+"""
+SQL_SUGGEST_PRODUCTS = f"""
+    SELECT BRAND, PRODUCT, {_PRICE_FOR_CUSTOMER_TYPE} as PRICE FROM INVENTORY
+    WHERE ID IN (SELECT rowid FROM INVENTORY_FTS WHERE INVENTORY_FTS MATCH ?2)
+    LIMIT ?3
+"""
+
+# --- Schema ---
+# The two hot tables are STRICT, so every value is stored with its declared type.
+# Prices are REAL, since the billing page accepts fractional prices (step 0.01).
+# {table} lets migrate_to_strict() build a copy under a temporary name.
+
+CUSTOMER_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        CUSTOMER_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+        CUSTOMER_NAME TEXT NOT NULL CHECK(CUSTOMER_NAME <> ''),
+        MOBILE_NO TEXT NOT NULL,
+        CUSTOMER_TYPE TEXT NOT NULL CHECK(CUSTOMER_TYPE IN ('WHOLESALE', 'RETAIL', 'HOTEL-LINE')),
+        -- Display form of the customer type, matching the options of the billing page's type dropdown
+        CUSTOMER_TYPE_DISPLAY TEXT GENERATED ALWAYS AS (CASE CUSTOMER_TYPE
+            WHEN 'WHOLESALE' THEN 'Wholesale'
+            WHEN 'RETAIL' THEN 'Retail'
+            WHEN 'HOTEL-LINE' THEN 'Hotel-Line'
+        END) VIRTUAL
+    ) STRICT
+"""
+INVENTORY_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        ID INTEGER PRIMARY KEY AUTOINCREMENT,
+        BRAND TEXT NOT NULL,
+        PRODUCT TEXT NOT NULL,
+        CATEGORY TEXT,
+        STOCK INT NOT NULL DEFAULT 0,
+        MRP REAL NOT NULL CHECK(MRP >= 0),
+        PURCHASE_RATE REAL NOT NULL CHECK(PURCHASE_RATE >= 0),
+        WHOLESALE_RATE REAL NOT NULL CHECK(WHOLESALE_RATE >= 0),
+        RETAIL_RATE REAL NOT NULL CHECK(RETAIL_RATE >= 0),
+        HOTEL_RATE REAL NOT NULL CHECK(HOTEL_RATE >= 0),
+        -- Indexed "BRAND PRODUCT" lookup key, so product-name matches don't scan the whole table
+        FULL_KEY TEXT GENERATED ALWAYS AS (TRIM(UPPER(BRAND)) || ' ' || TRIM(UPPER(PRODUCT))) STORED,
+        UNIQUE (BRAND, PRODUCT)
+    ) STRICT
+"""
+
+def migrate_to_strict(cursor, table, create_sql, columns, select_list):
+    """
+    Rebuilds a table created before the schema was STRICT: copies its rows into a new table
+    built from create_sql, then swaps it in. Indexes and triggers on the old table are dropped
+    with it and must be recreated afterwards. Foreign key enforcement must be off.
+    Returns True if the table was rebuilt.
+    """
+    cursor.execute("SELECT strict FROM pragma_table_list WHERE schema = 'main' AND name = ?", (table,))
+    if cursor.fetchone()[0]:
+        return False
+    # Keep the AUTOINCREMENT counter, so IDs of deleted rows are never handed out again
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,))
+    sequence = cursor.fetchone()
+    cursor.execute(create_sql.format(table=f'{table}_NEW'))
+    cursor.execute(f"INSERT INTO {table}_NEW ({columns}) SELECT {select_list} FROM {table}")
+    cursor.execute(f"DROP TABLE {table}")
+    cursor.execute(f"ALTER TABLE {table}_NEW RENAME TO {table}")
+    if sequence:
+        cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (sequence[0], table))
+    return True
+
+def setup_database():
+    """
+    Creates the necessary database tables if they don't exist and brings older databases
+    up to SCHEMA_VERSION. Does nothing if the database is already at that version.
+    Returns False if the schema could not be set up; the server must not start then.
+    """
+    with get_writer_conn() as conn:
+        if conn is None:
+            print("FATAL: Could not connect to the database to run setup.")
+            return False
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute("PRAGMA user_version")
+            db_version = cursor.fetchone()[0]
+            if db_version > SCHEMA_VERSION:
+                # Written by newer code; migrating it "back" would undo that code's changes
+                print(f"Database setup error: the database is newer than this code (schema version {db_version}, "
+                      f"this code supports {SCHEMA_VERSION}). Upgrade the application instead.")
+                return False
+            if db_version == SCHEMA_VERSION:
+                print("Database schema is up to date.")
+                return True
+
+            # Tables are rebuilt below, which SQLite only allows with foreign keys off
+            conn.execute("PRAGMA foreign_keys=OFF")
+            conn.execute("BEGIN IMMEDIATE")
+            # Create CUSTOMER and INVENTORY tables
+            cursor.execute(CUSTOMER_TABLE_SQL.format(table='CUSTOMER'))
+            cursor.execute(INVENTORY_TABLE_SQL.format(table='INVENTORY'))
+            # *** FIX: Schema updated to match the new screenshot exactly ***
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS BILLS (
+                    BILL_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                    CUSTOMER_ID INT,
+                    TOTAL_ITEMS INT NOT NULL,
+                    BILL_AMOUNT REAL NOT NULL,
+                    TAX_AMOUNT REAL,
+                    DISCOUNT_AMOUNT REAL DEFAULT 0,
+                    TOTAL_AMOUNT REAL,
+                    PROFIT_EARNED REAL,
+                    PAYMENT_METHOD TEXT CHECK(PAYMENT_METHOD IN ('ONLINE', 'CASH', 'CREDIT', 'CARD')),
+                    PAYMENT_DATE DATE,
+                    STATUS TEXT DEFAULT 'SUCCESSFUL' CHECK(STATUS IN ('SUCCESSFUL', 'PENDING', 'FAILED')),
+                    FOREIGN KEY(CUSTOMER_ID) REFERENCES CUSTOMER(CUSTOMER_ID)
+                )
+            """)
+            # Create BILL_ITEMS table (one row per billed inventory product)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS BILL_ITEMS (
+                    BILL_ID INTEGER NOT NULL,
+                    INVENTORY_ID INTEGER NOT NULL,
+                    QUANTITY INT NOT NULL,
+                    UNIT_PRICE REAL,
+                    FOREIGN KEY(BILL_ID) REFERENCES BILLS(BILL_ID),
+                    FOREIGN KEY(INVENTORY_ID) REFERENCES INVENTORY(ID)
+                )
+            """)
+            # Bring tables from older databases over to the STRICT layout
+            migrate_to_strict(
+                cursor, 'CUSTOMER', CUSTOMER_TABLE_SQL,
+                "CUSTOMER_ID, CUSTOMER_NAME, MOBILE_NO, CUSTOMER_TYPE",
+                # Names that are blank once trimmed fall back to the mobile number instead of failing the check
+                "CUSTOMER_ID, COALESCE(NULLIF(TRIM(CUSTOMER_NAME), ''), MOBILE_NO), MOBILE_NO, CUSTOMER_TYPE"
             )
-        """)
-        # *** FIX: Schema updated to match the new screenshot exactly ***
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS BILLS (
-                BILL_ID INTEGER PRIMARY KEY AUTOINCREMENT,
-                CUSTOMER_ID INT,
-                TOTAL_ITEMS INT NOT NULL,
-                BILL_AMOUNT REAL NOT NULL,
-                TAX_AMOUNT REAL,
-                DISCOUNT_AMOUNT REAL DEFAULT 0,
-                TOTAL_AMOUNT REAL,
-                PROFIT_EARNED REAL,
-                PAYMENT_METHOD TEXT CHECK(PAYMENT_METHOD IN ('ONLINE', 'CASH', 'CREDIT', 'CARD')),
-                PAYMENT_DATE DATE,
-                STATUS TEXT DEFAULT 'SUCCESSFUL' CHECK(STATUS IN ('SUCCESSFUL', 'PENDING', 'FAILED')),
-                FOREIGN KEY(CUSTOMER_ID) REFERENCES CUSTOMER(CUSTOMER_ID)
+            inventory_rebuilt = migrate_to_strict(
+                cursor, 'INVENTORY', INVENTORY_TABLE_SQL,
+                "ID, BRAND, PRODUCT, CATEGORY, STOCK, MRP, PURCHASE_RATE, WHOLESALE_RATE, RETAIL_RATE, HOTEL_RATE",
+                "ID, COALESCE(BRAND, ''), COALESCE(PRODUCT, ''), CATEGORY, COALESCE(STOCK, 0), MRP, PURCHASE_RATE, WHOLESALE_RATE, RETAIL_RATE, HOTEL_RATE"
             )
-        """)
-        conn.commit()
-        print("Database setup complete. Tables are ready.")
-    except sqlite3.Error as e:
-        print(f"Database setup error: {e}")
-    finally:
-        if conn:
-            conn.close()
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_inventory_fullkey ON INVENTORY(FULL_KEY)")
+            # Unique, so customer creation can resolve duplicates with ON CONFLICT(MOBILE_NO).
+            # Older databases never enforced this, so name any clashing numbers instead of failing blind.
+            cursor.execute("SELECT MOBILE_NO FROM CUSTOMER GROUP BY MOBILE_NO HAVING COUNT(*) > 1 ORDER BY MOBILE_NO")
+            duplicate_mobiles = [row[0] for row in cursor.fetchall()]
+            if duplicate_mobiles:
+                raise sqlite3.IntegrityError(
+                    "CUSTOMER has several rows for mobile number(s) " + ", ".join(duplicate_mobiles)
+                    + "; merge or correct them so each number belongs to one customer, then restart."
+                )
+            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_customer_mobile_unique ON CUSTOMER(MOBILE_NO)")
+            cursor.execute("DROP INDEX IF EXISTS idx_customer_mobile")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_bills_customer ON BILLS(CUSTOMER_ID)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_bill_items_bill ON BILL_ITEMS(BILL_ID)")
+            # Full-text index over brand/product names for the product search box, kept in sync by triggers
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'INVENTORY_FTS'")
+            fts_exists = cursor.fetchone() is not None
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS INVENTORY_FTS USING fts5(
+                    BRAND, PRODUCT, content='INVENTORY', content_rowid='ID', tokenize='unicode61'
+                )
+            """)
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS INVENTORY_FTS_AI AFTER INSERT ON INVENTORY BEGIN
+                    INSERT INTO INVENTORY_FTS(rowid, BRAND, PRODUCT) VALUES (new.ID, new.BRAND, new.PRODUCT);
+                END
+            """)
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS INVENTORY_FTS_AD AFTER DELETE ON INVENTORY BEGIN
+                    INSERT INTO INVENTORY_FTS(INVENTORY_FTS, rowid, BRAND, PRODUCT) VALUES ('delete', old.ID, old.BRAND, old.PRODUCT);
+                END
+            """)
+            # Only fires on name changes, so stock updates from billing don't touch the index
+            cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS INVENTORY_FTS_AU AFTER UPDATE OF BRAND, PRODUCT ON INVENTORY BEGIN
+                    INSERT INTO INVENTORY_FTS(INVENTORY_FTS, rowid, BRAND, PRODUCT) VALUES ('delete', old.ID, old.BRAND, old.PRODUCT);
+                    INSERT INTO INVENTORY_FTS(rowid, BRAND, PRODUCT) VALUES (new.ID, new.BRAND, new.PRODUCT);
+                END
+            """)
+            if not fts_exists or inventory_rebuilt:
+                cursor.execute("INSERT INTO INVENTORY_FTS(INVENTORY_FTS) VALUES ('rebuild')")
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+            print("Database setup complete. Tables are ready.")
+            return True
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Database setup error: {e}")
+            return False
+        finally:
+            conn.execute("PRAGMA foreign_keys=ON")
 
 # --- Web Server Routes ---
 
 @app.route('/api/customers', methods=['GET', 'POST'])
 def manage_customers():
     """
-    Handles fetching customer suggestions (GET) or 
+    Handles fetching customer suggestions (GET) or
     getting/creating a customer ID for a bill (POST).
     """
-    conn = connect_to_database()
-    if conn is None:
-        return jsonify({"error": "Database connection failed."}), 500
+    if request.method == 'GET':
+        search_term = request.args.get('term', '')
+        if len(search_term.strip()) < SUGGESTION_MIN_LENGTH: return ojsonify([])
+        cache_key = ('CUSTOMER', search_term)
+        cached = get_cached_suggestions(cache_key)
+        if cached is not None: return Response(cached, mimetype='application/json')
 
-    try:
-        if request.method == 'POST':
-            data = request.get_json()
-            customer_name = data.get('name')
-            mobile_no = data.get('phone')
-            customer_type = data.get('type')
+    borrow_conn = get_writer_conn if request.method == 'POST' else get_reader_conn
+    with borrow_conn() as conn:
+        if conn is None:
+            return jsonify({"error": "Database connection failed."}), 500
 
-            if not all([customer_name, mobile_no, customer_type]):
-                return jsonify({"error": "Missing data"}), 400
+        try:
+            if request.method == 'POST':
+                data = request.get_json()
+                customer_name = (data.get('name') or '').strip() # A blank name fails the CUSTOMER_NAME check
+                mobile_no = data.get('phone')
+                customer_type = data.get('type')
 
-            cursor = conn.cursor()
-            cursor.execute("SELECT CUSTOMER_ID FROM CUSTOMER WHERE MOBILE_NO = ?", (mobile_no,))
-            existing_customer = cursor.fetchone()
-            
-            if existing_customer:
-                customer_id = existing_customer['CUSTOMER_ID']
-                message = "Existing customer ID retrieved."
-            else:
-                customer_type_upper = customer_type.upper()
-                allowed_types = ['WHOLESALE', 'RETAIL', 'HOTEL-LINE']
-                if customer_type_upper not in allowed_types:
+                if not all([customer_name, mobile_no, customer_type]):
+                    return jsonify({"error": "Missing data"}), 400
+
+                customer_type_upper = sys.intern(customer_type.upper())
+                if customer_type_upper not in _ALLOWED_CUST:
                     return jsonify({"error": f"Invalid customer_type '{customer_type}'."}), 400
 
-                cursor.execute(
-                    "INSERT INTO CUSTOMER (CUSTOMER_NAME, MOBILE_NO, CUSTOMER_TYPE) VALUES (?, ?, ?)",
-                    (customer_name, mobile_no, customer_type_upper)
-                )
-                customer_id = cursor.lastrowid
-                message = "New customer created."
-                conn.commit()
+                cursor = conn.cursor()
+                # Returning customers (every bill) are a plain read; only unknown numbers take the write lock
+                cursor.execute(SQL_SELECT_CUST_BY_MOBILE, (mobile_no,))
+                existing_customer = cursor.fetchone()
+                new_customer = None
+                if not existing_customer:
+                    cursor.execute(SQL_INSERT_CUST, (customer_name, mobile_no, customer_type_upper))
+                    new_customer = cursor.fetchone()
+                    if not new_customer:
+                        cursor.execute(SQL_SELECT_CUST_BY_MOBILE, (mobile_no,))
+                        existing_customer = cursor.fetchone()
 
-            return jsonify({"message": message, "customer_id": customer_id}), 201
+                if new_customer:
+                    customer_id = new_customer['CUSTOMER_ID']
+                    message = "New customer created."
+                    clear_suggestion_cache()
+                else:
+                    customer_id = existing_customer['CUSTOMER_ID']
+                    message = "Existing customer ID retrieved."
 
-        else: # GET request for suggestions
-            search_term = request.args.get('term', '')
-            if not search_term: return jsonify([])
-            cursor = conn.cursor()
-            query = "SELECT CUSTOMER_NAME, MOBILE_NO, CUSTOMER_TYPE FROM CUSTOMER WHERE TRIM(CUSTOMER_NAME) LIKE ?"
-            cursor.execute(query, (f'{search_term}%',))
-            rows = cursor.fetchall()
-            customers = [{"name": row['CUSTOMER_NAME'].strip(), "mobile": row['MOBILE_NO'], "type": row['CUSTOMER_TYPE'].title()} for row in rows]
-            return jsonify(customers)
+                return jsonify({"message": message, "customer_id": customer_id}), 201
 
-    except Exception as e:
-        print("\n" + "="*50 + "\n!!! UNEXPECTED ERROR IN manage_customers !!!"); traceback.print_exc(); print("="*50 + "\n")
-        if conn: conn.rollback()
-        return jsonify({"error": "An internal server error occurred."}), 500
-    finally:
-        if conn: conn.close()
+            else: # GET request for suggestions
+                cursor = conn.cursor()
+                cursor.execute(SQL_SUGGEST_CUST, (f'{search_term}%', SUGGESTION_LIMIT))
+                customers = [{"name": row[0], "mobile": row[1], "type": row[2]} for row in cursor]
+                return Response(cache_suggestions(cache_key, customers), mimetype='application/json')
+
+        except Exception as e:
+            print("\n" + "="*50 + "\n!!! UNEXPECTED ERROR IN manage_customers !!!"); traceback.print_exc(); print("="*50 + "\n")
+            conn.rollback()
+            return jsonify({"error": "An internal server error occurred."}), 500
 
 @app.route('/api/process-bill', methods=['POST'])
 def process_bill():
@@ -154,8 +485,8 @@ def process_bill():
 
     customer_id = data.get('customer_id')
     products = data.get('products')
-    payment_method = data.get('payment_method', '').upper()
-    
+    payment_method = sys.intern(data.get('payment_method', '').upper())
+
     try:
         subtotal = float(data.get('subtotal', 0))
         tax = float(data.get('tax', 0))
@@ -166,106 +497,92 @@ def process_bill():
     if not all([customer_id, products, payment_method]):
         return jsonify({"error": "Missing critical bill data (customer, products, or payment method)."}), 400
 
-    conn = connect_to_database()
-    if conn is None: return jsonify({"error": "Database connection failed."}), 500
+    with get_writer_conn() as conn:
+        if conn is None: return jsonify({"error": "Database connection failed."}), 500
 
-    try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT CUSTOMER_TYPE FROM CUSTOMER WHERE CUSTOMER_ID = ?", (customer_id,))
-        customer_row = cursor.fetchone()
-        if not customer_row:
-            return jsonify({"error": "Customer not found."}), 404
-        customer_type = customer_row['CUSTOMER_TYPE']
-
-        price_column_map = {'WHOLESALE': 'WHOLESALE_RATE', 'RETAIL': 'RETAIL_RATE', 'HOTEL-LINE': 'HOTEL_RATE'}
-        price_column = price_column_map.get(customer_type)
-        total_profit_earned = 0.0
-        valid_products_count = 0
-
-        for product in products:
-            product_name = product.get('name')
-            try:
-                quantity_sold = int(product.get('quantity'))
-            except (ValueError, TypeError):
-                continue
-
-            if not product_name or quantity_sold <= 0:
-                continue
-            
-            valid_products_count += 1
-            
-            query = f"""
-                SELECT PURCHASE_RATE, {price_column} as SELLING_PRICE 
-                FROM INVENTORY 
-                WHERE (TRIM(UPPER(BRAND)) || ' ' || TRIM(UPPER(PRODUCT))) = ?
-            """
-            cursor.execute(query, (product_name.upper(),))
-            rates = cursor.fetchone()
-            
-            if rates and rates['PURCHASE_RATE'] is not None and rates['SELLING_PRICE'] is not None:
-                total_profit_earned += (rates['SELLING_PRICE'] - rates['PURCHASE_RATE']) * quantity_sold
-            
-            update_sql = "UPDATE INVENTORY SET STOCK = STOCK - ? WHERE (TRIM(UPPER(BRAND)) || ' ' || TRIM(UPPER(PRODUCT))) = ?"
-            cursor.execute(update_sql, (quantity_sold, product_name.upper()))
-
-        if valid_products_count == 0:
-            return jsonify({"error": "No valid products to bill."}), 400
-
-        payment_map = {'CASH': 'CASH', 'CARD': 'CARD', 'CREDIT': 'CREDIT', 'UPI': 'ONLINE'}
-        db_payment_method = payment_map.get(payment_method, 'CASH')
-        
-        # *** FIX: Using new column names (TAX_AMOUNT, STATUS) in the INSERT statement ***
-        bill_sql = """
-            INSERT INTO BILLS (CUSTOMER_ID, TOTAL_ITEMS, BILL_AMOUNT, TAX_AMOUNT, TOTAL_AMOUNT, PROFIT_EARNED, PAYMENT_METHOD, PAYMENT_DATE, STATUS)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        cursor.execute(bill_sql, (customer_id, valid_products_count, subtotal, tax, total, total_profit_earned, db_payment_method, datetime.now().strftime("%Y-%m-%d"), 'SUCCESSFUL'))
-        bill_id = cursor.lastrowid
-        conn.commit()
-        return jsonify({"message": f"Bill #{bill_id} generated successfully!", "bill_id": bill_id}), 201
+        try:
+            # One write transaction for the whole bill instead of one per statement
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.cursor()
+            customer_type = _CUST_TYPE_CACHE.get(customer_id)
+            if customer_type is None:
+                cursor.execute(SQL_SELECT_CUST_TYPE, (customer_id,))
+                customer_row = cursor.fetchone()
+                if not customer_row:
+                    return jsonify({"error": "Customer not found."}), 404
+                customer_type = customer_row['CUSTOMER_TYPE']
+                cache_customer_type(customer_id, customer_type)
 
-    except Exception as e:
-        if conn: conn.rollback()
-        print("\n" + "="*50 + "\n!!! UNEXPECTED ERROR IN process_bill !!!"); traceback.print_exc(); print("="*50 + "\n")
-        return jsonify({"error": "An internal server error occurred while processing the bill."}), 500
-    finally:
-        if conn: conn.close()
+            total_profit_earned = 0.0
+            line_items = [] # (upper-cased product name, quantity) for every valid line
+
+            for product in products:
+                product_name = product.get('name')
+                try:
+                    quantity_sold = int(product.get('quantity'))
+                except (ValueError, TypeError):
+                    continue
+
+                if not product_name or quantity_sold <= 0:
+                    continue
+
+                line_items.append((product_name.upper(), quantity_sold))
+
+            valid_products_count = len(line_items)
+            if valid_products_count == 0:
+                return jsonify({"error": "No valid products to bill."}), 400
+
+            # Fetch the rates for every product on the bill in one query...
+            product_names = list({name for name, _ in line_items})
+            cursor.execute(SQL_SELECT_RATES, (customer_type, json.dumps(product_names)))
+            rates_by_name = {row['FULL_KEY']: row for row in cursor.fetchall()}
+
+            bill_items = [] # (inventory ID, quantity, unit price) for lines that match an inventory product
+            for product_name, quantity_sold in line_items:
+                rates = rates_by_name.get(product_name)
+                if not rates:
+                    continue
+                bill_items.append((rates['ID'], quantity_sold, rates['SELLING_PRICE']))
+                if rates['PURCHASE_RATE'] is not None and rates['SELLING_PRICE'] is not None:
+                    total_profit_earned += (rates['SELLING_PRICE'] - rates['PURCHASE_RATE']) * quantity_sold
+
+            # ...and take the stock off with a single batched statement
+            cursor.executemany(SQL_UPDATE_STOCK, [(quantity_sold, product_name) for product_name, quantity_sold in line_items])
+
+            db_payment_method = _PAYMENT_MAP.get(payment_method, 'CASH')
+
+            cursor.execute(SQL_INSERT_BILL, (customer_id, valid_products_count, subtotal, tax, total, total_profit_earned, db_payment_method, 'SUCCESSFUL'))
+            bill_id = cursor.lastrowid
+            cursor.executemany(SQL_INSERT_BILL_ITEM, [(bill_id, *item) for item in bill_items])
+            conn.execute("COMMIT")
+            return jsonify({"message": f"Bill #{bill_id} generated successfully!", "bill_id": bill_id}), 201
+
+        except Exception as e:
+            conn.rollback()
+            print("\n" + "="*50 + "\n!!! UNEXPECTED ERROR IN process_bill !!!"); traceback.print_exc(); print("="*50 + "\n")
+            return jsonify({"error": "An internal server error occurred while processing the bill."}), 500
 
 @app.route('/api/bills', methods=['GET'])
 def get_bills():
-    """Fetches all bill records for the history page."""
-    conn = connect_to_database()
-    if conn is None:
-        return jsonify({"error": "Database connection failed."}), 500
-    try:
-        cursor = conn.cursor()
-        # *** FIX: Selecting from the new column names to send to the frontend ***
-        query = """
-            SELECT
-                b.BILL_ID,
-                c.CUSTOMER_NAME,
-                b.TOTAL_ITEMS,
-                b.BILL_AMOUNT,
-                b.TAX_AMOUNT,
-                b.DISCOUNT_AMOUNT,
-                b.TOTAL_AMOUNT,
-                b.PROFIT_EARNED,
-                b.PAYMENT_METHOD,
-                b.PAYMENT_DATE,
-                b.STATUS
-            FROM BILLS b
-            JOIN CUSTOMER c ON b.CUSTOMER_ID = c.CUSTOMER_ID
-            ORDER BY b.BILL_ID DESC
-        """
-        cursor.execute(query)
-        bills = [dict(row) for row in cursor.fetchall()]
-        return jsonify(bills)
-    except Exception as e:
-        print("\n" + "="*50 + "\n!!! UNEXPECTED ERROR IN get_bills !!!"); traceback.print_exc(); print("="*50 + "\n")
-        return jsonify({"error": "Failed to fetch bill history."}), 500
-    finally:
-        if conn:
-            conn.close()
+    """
+    Fetches bill records for the history page, newest first, paginated by ?limit= and ?before_id=
+    (the last BILL_ID already received). Keyset paging: bills saved meanwhile don't shift later pages.
+    """
+    limit = min(max(request.args.get('limit', BILLS_PAGE_SIZE, type=int), 1), BILLS_MAX_PAGE_SIZE)
+    before_id = request.args.get('before_id', sys.maxsize, type=int)
+    with get_reader_conn() as conn:
+        if conn is None:
+            return jsonify({"error": "Database connection failed."}), 500
+        try:
+            cursor = conn.cursor()
+            cursor.row_factory = None # Plain tuples; column names are read once from the description
+            cursor.execute(SQL_SELECT_BILLS_JOIN, (before_id, limit))
+            columns = [col[0] for col in cursor.description]
+            bills = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            return ojsonify(bills)
+        except Exception as e:
+            print("\n" + "="*50 + "\n!!! UNEXPECTED ERROR IN get_bills !!!"); traceback.print_exc(); print("="*50 + "\n")
+            return jsonify({"error": "Failed to fetch bill history."}), 500
 
 @app.route('/')
 def index():
@@ -289,31 +606,37 @@ def history():
 @app.route('/api/products', methods=['GET'])
 def get_product_suggestions():
     """Fetches product suggestions and prices."""
-    search_term, customer_type = request.args.get('term', ''), request.args.get('customer_type', '').upper()
-    if not search_term or not customer_type: return jsonify([])
-    price_column_map = {'WHOLESALE': 'WHOLESALE_RATE', 'RETAIL': 'RETAIL_RATE', 'HOTEL-LINE': 'HOTEL_RATE'}
-    price_column = price_column_map.get(customer_type)
-    if not price_column: return jsonify({"error": "Invalid customer type"}), 400
-    conn = connect_to_database()
-    if conn is None: return jsonify({"error": "Database connection failed."}), 500
-    try:
-        cursor = conn.cursor()
-        query = f"SELECT BRAND, PRODUCT, {price_column} as PRICE FROM INVENTORY WHERE (UPPER(BRAND) || ' ' || UPPER(PRODUCT)) LIKE ?"
-        cursor.execute(query, (f'%{search_term.upper()}%',))
-        rows = cursor.fetchall()
-        products = [{"name": f"{row['BRAND']} {row['PRODUCT']}".strip(), "price": row['PRICE']} for row in rows]
-        return jsonify(products)
-    except Exception as e:
-        print("\n" + "="*50 + "\n!!! UNEXPECTED ERROR IN get_product_suggestions !!!"); traceback.print_exc(); print("="*50 + "\n")
-        return jsonify({"error": "Failed to query database."}), 500
-    finally:
-        if conn: conn.close()
+    search_term, customer_type = request.args.get('term', ''), sys.intern(request.args.get('customer_type', '').upper())
+    if len(search_term.strip()) < SUGGESTION_MIN_LENGTH or not customer_type: return ojsonify([])
+    if customer_type not in _ALLOWED_CUST: return jsonify({"error": "Invalid customer type"}), 400
+    # Prefix-match every word of the term against the full-text index, e.g. 'max fr' -> "max"* "fr"*
+    match_query = ' '.join('"' + word.replace('"', '""') + '"*' for word in search_term.split())
+    cache_key = ('PRODUCT', search_term, customer_type)
+    cached = get_cached_suggestions(cache_key)
+    if cached is not None: return Response(cached, mimetype='application/json')
+    with get_reader_conn() as conn:
+        if conn is None: return jsonify({"error": "Database connection failed."}), 500
+        try:
+            cursor = conn.cursor()
+            cursor.execute(SQL_SUGGEST_PRODUCTS, (customer_type, match_query, SUGGESTION_LIMIT))
+            rows = cursor.fetchall()
+            products = [{"name": f"{row['BRAND']} {row['PRODUCT']}".strip(), "price": row['PRICE']} for row in rows]
+            return Response(cache_suggestions(cache_key, products), mimetype='application/json')
+        except Exception as e:
+            print("\n" + "="*50 + "\n!!! UNEXPECTED ERROR IN get_product_suggestions !!!"); traceback.print_exc(); print("="*50 + "\n")
+            return jsonify({"error": "Failed to query database."}), 500
 
 # --- Main Execution ---
 if __name__ == '__main__':
     if not os.path.exists(DATABASE_FILE):
         print(f"Database file '{DATABASE_FILE}' not found. Will be created.")
-    setup_database()
+    if not setup_database():
+        sys.exit("Database setup failed; not starting the server.")
     print(f"Starting server, using database '{DATABASE_FILE}'...")
-    app.run(host='0.0.0.0', port=5000, debug=True)
-
+    # On Linux, gunicorn can be used instead: `gunicorn app:app` (settings in gunicorn.conf.py)
+    try:
+        from waitress import serve
+        serve(app, host='0.0.0.0', port=5000, threads=SERVER_THREADS)
+    except ImportError:
+        print("waitress is not installed, falling back to Flask's threaded development server.")
+        app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
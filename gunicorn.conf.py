@@ -0,0 +1,17 @@
+# Gunicorn settings for running the billing server in production:
+#     gunicorn app:app
+# One worker process with threads: the connection pool and caches in app.py are per-process,
+# and SQLite in WAL mode lets the threads read concurrently.
+from app import SERVER_THREADS, close_pool, setup_database
+
+bind = '0.0.0.0:5000'
+workers = 1
+worker_class = 'gthread'
+threads = SERVER_THREADS
+
+def on_starting(server):
+    """Runs the schema setup once, before any worker starts serving requests."""
+    if not setup_database():
+        raise SystemExit("Database setup failed; not starting the server.")
+    # SQLite connections must not be carried across fork(); workers open their own
+    close_pool()
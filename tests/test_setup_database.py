@@ -0,0 +1,111 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import app
+
+# CUSTOMER and INVENTORY as created before the schema was versioned (user_version 0)
+LEGACY_SCHEMA = """
+    CREATE TABLE CUSTOMER (
+        CUSTOMER_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+        CUSTOMER_NAME TEXT NOT NULL,
+        MOBILE_NO TEXT NOT NULL UNIQUE,
+        CUSTOMER_TYPE TEXT NOT NULL CHECK(CUSTOMER_TYPE IN ('WHOLESALE', 'RETAIL', 'HOTEL-LINE'))
+    );
+    CREATE TABLE INVENTORY (
+        ID INTEGER PRIMARY KEY AUTOINCREMENT,
+        BRAND TEXT,
+        PRODUCT TEXT,
+        CATEGORY TEXT,
+        STOCK INT,
+        MRP INT NOT NULL,
+        PURCHASE_RATE INT NOT NULL,
+        WHOLESALE_RATE INT NOT NULL,
+        RETAIL_RATE INT NOT NULL,
+        HOTEL_RATE INT NOT NULL,
+        UNIQUE (BRAND, PRODUCT)
+    );
+"""
+
+
+class SetupDatabaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmpdir, app.DATABASE_FILE)
+        self.original_db_path = app.DB_PATH
+        app.close_pool()
+        app.DB_PATH = self.db_path
+
+    def tearDown(self):
+        app.close_pool()
+        app.DB_PATH = self.original_db_path
+        shutil.rmtree(self.tmpdir)
+
+    def create_legacy_database(self, inventory_rows, customer_rows=()):
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript(LEGACY_SCHEMA)
+        conn.executemany("""
+            INSERT INTO INVENTORY (BRAND, PRODUCT, CATEGORY, STOCK, MRP, PURCHASE_RATE, WHOLESALE_RATE, RETAIL_RATE, HOTEL_RATE)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, inventory_rows)
+        conn.executemany("INSERT INTO CUSTOMER (CUSTOMER_NAME, MOBILE_NO, CUSTOMER_TYPE) VALUES (?, ?, ?)", customer_rows)
+        conn.commit()
+        conn.close()
+
+    def test_migrates_non_integer_rates(self):
+        self.create_legacy_database([
+            ('COLGATE', 'MAX FRESH 105g', 'Toothpaste', 10, 99.5, 80.25, 85.75, '99.5', 97),
+            ('HARPIC', 'RED 100ml', 'Cleaner', 5, 40, 30, 34, 38, 36),
+        ])
+
+        self.assertTrue(app.setup_database())
+
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], app.SCHEMA_VERSION)
+        self.assertEqual(conn.execute("SELECT strict FROM pragma_table_list WHERE name = 'INVENTORY'").fetchone()[0], 1)
+        self.assertEqual(
+            conn.execute("SELECT MRP, PURCHASE_RATE, WHOLESALE_RATE, RETAIL_RATE, HOTEL_RATE FROM INVENTORY WHERE ID = 1").fetchone(),
+            (99.5, 80.25, 85.75, 99.5, 97.0)
+        )
+        conn.close()
+
+        response = app.app.test_client().get('/api/products?term=colgate&customer_type=retail')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()[0]['price'], 99.5)
+
+    def test_migrates_blank_customer_names(self):
+        self.create_legacy_database([], [('  Asha  ', '9000000001', 'RETAIL'), ('   ', '9000000002', 'WHOLESALE')])
+
+        self.assertTrue(app.setup_database())
+
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(
+            conn.execute("SELECT CUSTOMER_NAME FROM CUSTOMER ORDER BY CUSTOMER_ID").fetchall(),
+            [('Asha',), ('9000000002',)]
+        )
+        conn.close()
+
+    def test_refuses_database_from_newer_code(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(f"PRAGMA user_version = {app.SCHEMA_VERSION + 1}")
+        conn.close()
+
+        self.assertFalse(app.setup_database())
+
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], app.SCHEMA_VERSION + 1)
+        self.assertIsNone(conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'CUSTOMER'").fetchone())
+        conn.close()
+
+    def test_rejects_blank_customer_name(self):
+        self.assertTrue(app.setup_database())
+
+        response = app.app.test_client().post('/api/customers', json={'name': '   ', 'phone': '9000000003', 'type': 'retail'})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()